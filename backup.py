@@ -12,6 +12,7 @@ import re
 from typing import Iterable
 
 import boto3
+from studiop.sdk.encrypt import TinkCryptor
 
 UTF_8 = "utf-8"
 HOME = pathlib.Path().home()
@@ -51,6 +52,10 @@ session = boto3.Session(profile_name="truenas")
 s3 = session.resource("s3", endpoint_url="http://truenas.studiop:9000")
 bucket = s3.Bucket("test")
 
+# Set BACKUP_KEYFILE to encrypt every file client-side before it is uploaded
+KEYFILE = os.getenv("BACKUP_KEYFILE")
+cryptor = TinkCryptor(KEYFILE) if KEYFILE else None
+
 
 def scan_tree(path: pathlib.Path, excludes: Iterable = ()):
     exclude_patterns = [fnmatch.translate(f"{path}/{exp}") for exp in excludes]
@@ -67,6 +72,16 @@ def scan_tree(path: pathlib.Path, excludes: Iterable = ()):
             dirnames.remove(folder)
 
 
+def upload_file(file: pathlib.Path):
+    key = str(file).removeprefix(f"{SOURCE}/")
+    if cryptor is None:
+        bucket.upload_file(Filename=str(file), Key=key)
+        return
+    # Ciphertext is produced while boto3 reads the body, no temp copy on disk
+    with file.open("rb") as source:
+        bucket.upload_fileobj(cryptor.encrypting_stream(source, key), key)
+
+
 counts = {"new": 0, "changed": 0, "unchanged": 0, "removed": 0}
 changes = {"new": [], "changed": [], "removed": []}
 new_cache = {}
@@ -82,14 +97,14 @@ def handle_file(file: pathlib.Path):
         counts["new"] += 1
         # if not FIRST_RUN:
         #     changes["new"].append(key)
-        bucket.upload_file(Filename=key, Key=key.removeprefix(f"{SOURCE}/"))
+        upload_file(file)
     elif metadata_hash != cache[key]:
         new_cache[key] = metadata_hash
         print(f"Changed: {key}")
         counts["changed"] += 1
         # if not FIRST_RUN:
         #     changes["changed"].append(key)
-        bucket.upload_file(Filename=key, Key=key.removeprefix(f"{SOURCE}/"))
+        upload_file(file)
     else:
         new_cache[key] = cache[key]
         print(f"Unchanged: {key}")
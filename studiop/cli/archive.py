@@ -27,7 +27,7 @@ def setup() -> argparse.Namespace:
 
 def create_tasks(config: Dict) -> List[tasks.Task]:
     kwargs = {
-        "backend": backend.S3Backend(**config["backend"]),
+        "backend": backend.create_backend(config["backend"]),
         "archiver": archive.TarArchiver(**config["archiver"]),
         "encryptor": encrypt.TinkCryptor(**config.get("encryptor", None)),
     }
@@ -45,10 +45,16 @@ def create_tasks(config: Dict) -> List[tasks.Task]:
     #             )
     # else:
     #     tasklist.append(tasks.ArchiveTask(**entry, **kwargs))
-    tasklist = [tasks.ArchiveTask(**entry, **kwargs) for entry in config["tasks"]]
+    tasklist = [create_task(entry, kwargs) for entry in config["tasks"]]
     return tasklist
 
 
+def create_task(entry: Dict, kwargs: Dict) -> tasks.Task:
+    if "volume_size" in entry:
+        return tasks.VolumeArchiveTask(**entry, **kwargs)
+    return tasks.ArchiveTask(**entry, **kwargs)
+
+
 def main():
     args = setup()
     with args.config_file.open(READ, encoding=UTF_8) as config_file:
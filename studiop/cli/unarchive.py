@@ -22,14 +22,20 @@ def setup() -> argparse.Namespace:
 
 def create_tasks(config: Dict) -> List[tasks.Task]:
     kwargs = {
-        "backend": backend.S3Backend(**config["backend"]),
+        "backend": backend.create_backend(config["backend"]),
         "archiver": archive.TarArchiver(**config["archiver"]),
         "decryptor": encrypt.TinkCryptor(**config.get("encryptor", None)),
     }
-    tasklist = [tasks.UnarchiveTask(**entry, **kwargs) for entry in config["tasks"]]
+    tasklist = [create_task(entry, kwargs) for entry in config["tasks"]]
     return tasklist
 
 
+def create_task(entry: Dict, kwargs: Dict) -> tasks.Task:
+    if entry.pop("volumes", False):
+        return tasks.VolumeUnarchiveTask(**entry, **kwargs)
+    return tasks.UnarchiveTask(**entry, **kwargs)
+
+
 def main():
     args = setup()
     with args.config_file.open("r", encoding="utf-8") as config_file:
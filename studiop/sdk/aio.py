@@ -0,0 +1,265 @@
+import abc
+import asyncio
+import functools
+import os
+import pathlib
+from concurrent import futures
+from typing import BinaryIO, Iterable, List, Union
+
+from studiop import logging
+from studiop.sdk import archive, backend, backup, encrypt, restic, tasks, utils
+
+
+class AsyncBackend(metaclass=abc.ABCMeta):
+    @abc.abstractmethod
+    async def upload(self, key: str, data: BinaryIO):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def download(self, key: str) -> BinaryIO:
+        raise NotImplementedError
+
+
+class AsyncArchiver(metaclass=abc.ABCMeta):
+    @abc.abstractmethod
+    async def archive(
+        self, src: Union[str, pathlib.Path], exclude: List[str] = None
+    ) -> BinaryIO:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def unarchive(self, data: BinaryIO, dest: Union[str, pathlib.Path]):
+        raise NotImplementedError
+
+
+class AsyncCryptor(metaclass=abc.ABCMeta):
+    @abc.abstractmethod
+    async def encrypt(
+        self, data: BinaryIO, associated_data: Union[str, bytes] = b""
+    ) -> BinaryIO:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    async def decrypt(
+        self, data: BinaryIO, associated_data: Union[str, bytes] = b""
+    ) -> BinaryIO:
+        raise NotImplementedError
+
+
+class AsyncStreamingCryptor(metaclass=abc.ABCMeta):
+    @abc.abstractmethod
+    async def encrypting_stream(
+        self, data: BinaryIO, associated_data: Union[str, bytes] = b""
+    ) -> BinaryIO:
+        raise NotImplementedError
+
+
+class AsyncTask(metaclass=abc.ABCMeta):
+    @abc.abstractmethod
+    async def run(self):
+        raise NotImplementedError
+
+
+class _ExecutorAdapter:
+    # Runs the blocking methods of a sync object in an executor. With no
+    # executor given, the event loop's default thread pool is used.
+    def __init__(self, wrapped, executor: futures.Executor = None) -> None:
+        self._wrapped = wrapped
+        self._executor = executor
+
+    async def _call(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(func, *args, **kwargs)
+        )
+
+
+class BackendAdapter(_ExecutorAdapter, AsyncBackend):
+    def __init__(
+        self, wrapped: backend.Backend, executor: futures.Executor = None
+    ) -> None:
+        super().__init__(wrapped, executor)
+
+    async def upload(self, key: str, data: BinaryIO):
+        return await self._call(self._wrapped.upload, key, data)
+
+    async def download(self, key: str) -> BinaryIO:
+        return await self._call(self._wrapped.download, key)
+
+
+class ArchiverAdapter(_ExecutorAdapter, AsyncArchiver):
+    def __init__(
+        self, wrapped: archive.Archiver, executor: futures.Executor = None
+    ) -> None:
+        super().__init__(wrapped, executor)
+
+    async def archive(
+        self, src: Union[str, pathlib.Path], exclude: List[str] = None
+    ) -> BinaryIO:
+        return await self._call(self._wrapped.archive, src, exclude)
+
+    async def unarchive(self, data: BinaryIO, dest: Union[str, pathlib.Path]):
+        return await self._call(self._wrapped.unarchive, data, dest)
+
+
+class CryptorAdapter(_ExecutorAdapter, AsyncCryptor):
+    def __init__(
+        self, wrapped: encrypt.Cryptor, executor: futures.Executor = None
+    ) -> None:
+        super().__init__(wrapped, executor)
+
+    async def encrypt(
+        self, data: BinaryIO, associated_data: Union[str, bytes] = b""
+    ) -> BinaryIO:
+        return await self._call(self._wrapped.encrypt, data, associated_data)
+
+    async def decrypt(
+        self, data: BinaryIO, associated_data: Union[str, bytes] = b""
+    ) -> BinaryIO:
+        return await self._call(self._wrapped.decrypt, data, associated_data)
+
+
+class StreamingCryptorAdapter(CryptorAdapter, AsyncStreamingCryptor):
+    def __init__(
+        self, wrapped: encrypt.StreamingCryptor, executor: futures.Executor = None
+    ) -> None:
+        if not isinstance(wrapped, encrypt.StreamingCryptor):
+            raise TypeError(f"{wrapped.__class__.__name__} cannot encrypt streams")
+        super().__init__(wrapped, executor)
+
+    async def encrypting_stream(
+        self, data: BinaryIO, associated_data: Union[str, bytes] = b""
+    ) -> BinaryIO:
+        # Reading the returned stream encrypts, so read it in an executor too
+        return await self._call(self._wrapped.encrypting_stream, data, associated_data)
+
+
+class TaskAdapter(_ExecutorAdapter, AsyncTask):
+    def __init__(self, wrapped: tasks.Task, executor: futures.Executor = None) -> None:
+        super().__init__(wrapped, executor)
+
+    async def run(self):
+        return await self._call(self._wrapped.run)
+
+
+class AsyncArchiveTask(tasks.ArchiveSetup, AsyncTask):
+    def __init__(
+        self,
+        source: Union[str, pathlib.Path],
+        backend: AsyncBackend,
+        archiver: AsyncArchiver,
+        dest: str = "",
+        exclude: List[str] = None,
+        encryptor: AsyncCryptor = None,
+    ) -> None:
+        super().__init__()
+        self._setup(source, backend, archiver, dest, exclude, encryptor)
+
+    async def run(self):
+        self._logger.info(f"Started archive task: {self.src}")
+        archived = await self._archiver.archive(self.src, self.exclude)
+        if self._encryptor:
+            archived = await self._encryptor.encrypt(archived, self.dest)
+        await self._backend.upload(self.dest, archived)
+        self._logger.info(f"Completed archive task: {self.src}")
+
+
+class AsyncUnarchiveTask(tasks.UnarchiveSetup, AsyncTask):
+    def __init__(
+        self,
+        source: str,
+        backend: AsyncBackend,
+        archiver: AsyncArchiver,
+        dest: Union[str, pathlib.Path] = ".",
+        decryptor: AsyncCryptor = None,
+    ) -> None:
+        super().__init__()
+        self._setup(source, backend, archiver, dest, decryptor)
+
+    async def run(self):
+        self._logger.info(f"Started unarchive task: {self.key}")
+        downloaded = await self._uploader.download(self.key)
+        if self._decryptor:
+            downloaded = await self._decryptor.decrypt(downloaded, self.key)
+        await self._archiver.unarchive(downloaded, self.dest)
+        self._logger.info(f"Completed unarchive task: {self.key}")
+
+
+class AsyncBackupTask(AsyncTask):
+    # restic runs as a child process awaited by the event loop, so no thread
+    # is held while a backup is in progress. Skips and summaries follow
+    # backup.Backup through the shared FingerprintCheck.
+    def __init__(
+        self,
+        src: Union[str, pathlib.Path],
+        repo: restic.ResticRepo,
+        exclude: List[str] = None,
+        bin_path: str = "restic",
+        force: bool = False,
+        fingerprints: backup.FingerprintCache = None,
+        executor: futures.Executor = None,
+    ) -> None:
+        super().__init__()
+        self.src = pathlib.Path(src)
+        self.repo = repo
+        self.exclude = exclude
+        self._restic = restic.Restic(bin_path)
+        self._check = backup.FingerprintCheck(
+            self.src,
+            repo.path,
+            exclude=exclude,
+            force=force,
+            fingerprints=fingerprints,
+        )
+        self._executor = executor
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    async def run(self) -> dict:
+        if not self.src.exists():
+            raise FileNotFoundError(f"Source path {self.src} does not exist")
+        self._logger.info(f"Starting backup: {self.src}")
+        loop = asyncio.get_running_loop()
+        if summary := await loop.run_in_executor(self._executor, self._check.unchanged):
+            self._logger.info(utils.print_dict(summary))
+            return summary
+
+        process = await asyncio.create_subprocess_exec(
+            *self._restic.backup_args(self.src, self.exclude),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env={**os.environ, **self.repo.env},
+        )
+        try:
+            stdout, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+        if process.returncode != 0:
+            raise restic.ResticError(
+                f"Backup of {self.src} failed ({process.returncode}): "
+                f"{stderr.decode().strip()}"
+            )
+        summary = self._check.finish(self._restic.parse_backup(stdout.decode()))
+        self._logger.info(f"Backup task finished: {self.src}")
+        self._logger.info(utils.print_dict(summary))
+        return summary
+
+
+async def run_tasks(tasklist: Iterable[AsyncTask], concurrency: int = 16) -> list:
+    # Shared budget: at most `concurrency` tasks are in flight at once.
+    # Failures are returned in place of results instead of cancelling the rest.
+    logger = logging.getLogger(__name__)
+    budget = asyncio.Semaphore(concurrency)
+
+    async def run_one(task: AsyncTask):
+        async with budget:
+            return await task.run()
+
+    results = await asyncio.gather(
+        *[run_one(task) for task in tasklist], return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            logger.error(f"Task failed: {result}")
+    return results
@@ -1,23 +1,31 @@
 import abc
 import fnmatch
+import os
 import pathlib
 import re
 import tarfile
 import tempfile
-from typing import BinaryIO, Callable, Iterable, List, Union
+from typing import BinaryIO, Callable, Iterable, List, Optional, Pattern, Union
 
 from studiop import DRY_RUN, logging
 from studiop.constants import BYTE, KILOBYTE, MEGABYTE
 from tqdm import tqdm
 
+TAR_BLOCK_SIZE = tarfile.BLOCKSIZE
+
+
+def create_pattern(exclude: Iterable[str] = ()) -> Optional[Pattern]:
+    if not exclude:
+        return None
+    exclude_patterns = [fnmatch.translate(exp) for exp in exclude]
+    return re.compile("|".join(exclude_patterns))
+
 
 def create_filter(exclude: Iterable[str] = ()):
-    if exclude:
-        exclude_patterns = [fnmatch.translate(exp) for exp in exclude]
-        exclude_pattern = re.compile("|".join(exclude_patterns))
+    exclude_pattern = create_pattern(exclude)
 
     def filter_func(item: tarfile.TarInfo) -> tarfile.TarInfo:
-        if exclude and exclude_pattern.match(item.name):
+        if exclude_pattern and exclude_pattern.match(item.name):
             return None
         else:
             print(f"Adding item: {item.name}")
@@ -38,7 +46,30 @@ class Archiver(metaclass=abc.ABCMeta):
         raise NotImplementedError
 
 
-class TarArchiver(Archiver):
+class MemberArchiver(metaclass=abc.ABCMeta):
+    # Optional capability needed by volume archives: archive an explicit list
+    # of members, and extract several archives into one tree, with folder
+    # attributes applied once every archive is extracted
+    @abc.abstractmethod
+    def archive_members(
+        self, src: Union[str, pathlib.Path], members: List[pathlib.Path]
+    ) -> BinaryIO:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def unarchive_members(
+        self, data: BinaryIO, dest: Union[str, pathlib.Path]
+    ) -> List[tarfile.TarInfo]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def finish_unarchive(
+        self, folders: List[tarfile.TarInfo], dest: Union[str, pathlib.Path]
+    ):
+        raise NotImplementedError
+
+
+class TarArchiver(Archiver, MemberArchiver):
     def __init__(self, compression: str = "") -> None:
         super().__init__()
         self.compression = compression
@@ -59,6 +90,24 @@ class TarArchiver(Archiver):
             tar.add(src, arcname=src.name, filter=create_filter(exclude))
         return tarstream
 
+    def archive_members(
+        self, src: Union[str, pathlib.Path], members: List[pathlib.Path]
+    ) -> BinaryIO:
+        # Names are relative to the parent of src, the same as archive()
+        src = pathlib.Path(src)
+        self._logger.info(f"Archiving {len(members)} items from {src}")
+        tarstream = tempfile.TemporaryFile()
+        filter_func = create_filter()
+        with tarfile.open(fileobj=tarstream, mode=f"w|{self.compression}") as tar:
+            for member in members:
+                tar.add(
+                    member,
+                    arcname=str(member.relative_to(src.parent)),
+                    recursive=False,
+                    filter=filter_func,
+                )
+        return tarstream
+
     def unarchive(self, data: BinaryIO, dest: Union[str, pathlib.Path]):
         self._logger.info(f"Extracting to {dest}")
         size = data.tell()
@@ -72,8 +121,104 @@ class TarArchiver(Archiver):
             ) as progress:
                 tar.extractall(dest, members=tar_tracker(tar, progress.update))
 
+    def unarchive_members(
+        self, data: BinaryIO, dest: Union[str, pathlib.Path]
+    ) -> List[tarfile.TarInfo]:
+        # Folders are created writable and returned, so a later archive can
+        # still add to a read-only folder. finish_unarchive applies them.
+        self._logger.info(f"Extracting to {dest}")
+        size = data.tell()
+        data.seek(0)
+        folders = []
+        with tarfile.open(fileobj=data, mode=f"r|{self.compression}") as tar:
+            with tqdm(
+                total=size,
+                unit=BYTE,
+                unit_divisor=KILOBYTE,
+                unit_scale=True,
+            ) as progress:
+                for member in tar_tracker(tar, progress.update):
+                    if member.isdir():
+                        folders.append(member)
+                    tar.extract(member, dest, set_attrs=not member.isdir())
+        return folders
+
+    def finish_unarchive(
+        self, folders: List[tarfile.TarInfo], dest: Union[str, pathlib.Path]
+    ):
+        # Deepest first, like tarfile.extractall, so mtimes are not reset
+        for folder in sorted(folders, key=lambda item: item.name, reverse=True):
+            path = os.path.join(dest, folder.name)
+            try:
+                os.chmod(path, folder.mode)
+                os.utime(path, (folder.mtime, folder.mtime))
+            except OSError as err:
+                self._logger.warning(f"Could not set attributes of {path}: {err}")
+
 
 def tar_tracker(archive: tarfile.TarFile, func: Callable):
     for member in archive:
         yield member
         func(member.size)
+
+
+def tar_size(size: int) -> int:
+    blocks = -(-size // TAR_BLOCK_SIZE)
+    return TAR_BLOCK_SIZE * (blocks + 1)
+
+
+def scan_members(src: pathlib.Path, exclude: Iterable[str] = ()):
+    # Excludes match the archive name of an item, same as create_filter
+    exclude_pattern = create_pattern(exclude)
+    root = src.parent
+
+    def excluded(path: str) -> bool:
+        return bool(exclude_pattern) and bool(
+            exclude_pattern.match(os.path.relpath(path, root))
+        )
+
+    if excluded(str(src)):
+        return
+    if not src.is_dir() or src.is_symlink():
+        yield src, src.lstat().st_size
+        return
+    yield src, 0
+    stack = [str(src)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in sorted(entries, key=lambda item: item.name):
+                if excluded(entry.path):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                    yield pathlib.Path(entry.path), 0
+                elif entry.is_file(follow_symlinks=False):
+                    yield pathlib.Path(entry.path), entry.stat(
+                        follow_symlinks=False
+                    ).st_size
+                else:
+                    yield pathlib.Path(entry.path), 0
+
+
+def plan_volumes(
+    src: Union[str, pathlib.Path], max_size: int, exclude: Iterable[str] = ()
+) -> List[List[pathlib.Path]]:
+    # Files are never split, one bigger than max_size gets its own volume
+    if max_size <= 0:
+        raise ValueError(f"Volume size must be positive, got {max_size}")
+    src = pathlib.Path(src)
+    if not src.exists():
+        raise FileNotFoundError(f"Source file/folder {src} does not exist")
+
+    volumes = []
+    current, current_size = [], 0
+    for path, size in scan_members(src, exclude):
+        size = tar_size(size)
+        if current and current_size + size > max_size:
+            volumes.append(current)
+            current, current_size = [], 0
+        current.append(path)
+        current_size += size
+    if current:
+        volumes.append(current)
+    return volumes
@@ -1,15 +1,26 @@
 import abc
+import io
+import pathlib
+import queue
 import tempfile
-from typing import BinaryIO
+import threading
+import time
+from typing import BinaryIO, Dict, List, Optional, Union
 
 import boto3
 from boto3.exceptions import S3UploadFailedError
 from botocore.exceptions import ClientError
 from studiop import DRY_RUN, logging
-from studiop.constants import BYTE, KILOBYTE
+from studiop.constants import BYTE, KILOBYTE, MEGABYTE, READ_B
 from tqdm import tqdm
 
 
+class FanoutError(Exception):
+    def __init__(self, message: str, results: Dict[str, Optional[Exception]]) -> None:
+        super().__init__(message)
+        self.results = results
+
+
 class Backend(metaclass=abc.ABCMeta):
     @abc.abstractmethod
     def upload(self, key: str, fileobj: BinaryIO):
@@ -57,6 +68,7 @@ class S3Backend(Backend):
                     self._logger.info(f"Successfully uploaded {key}")
                 except (S3UploadFailedError, ClientError) as err:
                     self._logger.error(err)
+                    raise
 
     def download(self, key: str) -> BinaryIO:
         self._logger.info(f"Downloading from s3://{self.bucket.name}/{key}")
@@ -71,3 +83,211 @@ class S3Backend(Backend):
             self.bucket.download_fileobj(key, output_stream, Callback=progress.update)
         self._logger.info(f"Successfully downloaded {key}")
         return output_stream
+
+
+class LocalBackend(Backend):
+    def __init__(self, root: Union[str, pathlib.Path]) -> None:
+        super().__init__()
+        self.root = pathlib.Path(root)
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def _path(self, key: str) -> pathlib.Path:
+        path = self.root.joinpath(key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Key {key} is outside of {self.root}")
+        return path
+
+    def upload(self, key: str, data: BinaryIO):
+        path = self._path(key)
+        self._logger.info(f"Copying to {path}")
+        with data:
+            if not DRY_RUN:
+                path.parent.mkdir(parents=True, exist_ok=True)
+                tmp_path = path.with_name(f".{path.name}.part")
+                with tqdm(
+                    total=data.tell(),
+                    unit=BYTE,
+                    unit_scale=True,
+                    unit_divisor=KILOBYTE,
+                ) as progress, tmp_path.open("wb") as output_stream:
+                    data.seek(0)
+                    while chunk := data.read(MEGABYTE):
+                        progress.update(output_stream.write(chunk))
+                tmp_path.replace(path)
+                self._logger.info(f"Successfully copied {key}")
+
+    def download(self, key: str) -> BinaryIO:
+        path = self._path(key)
+        self._logger.info(f"Reading from {path}")
+        output_stream = path.open(READ_B)
+        output_stream.seek(0, io.SEEK_END)
+        return output_stream
+
+
+class _FanoutReader(io.RawIOBase):
+    # Read side of one fan-out destination, fed chunk by chunk from a bounded
+    # queue so the producer blocks on the slowest destination.
+    def __init__(self, size: int, queue_size: int) -> None:
+        super().__init__()
+        self._size = size
+        self._position = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._buffer = b""
+        self._eof = False
+        self.done = threading.Event()
+        self.stalled = threading.Event()
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        # Backends size their progress from tell() before calling seek(0)
+        return self._size if self._position == 0 else self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if offset == 0 and whence == io.SEEK_SET and self._position == 0:
+            return 0
+        raise io.UnsupportedOperation("Fan-out streams can only be read forward")
+
+    def feed(self, chunk: Optional[bytes], timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while not self.done.is_set():
+            try:
+                self._queue.put(chunk, timeout=0.1)
+                return True
+            except queue.Full:
+                if time.monotonic() > deadline:
+                    self.stalled.set()
+                    self.done.set()
+        return False
+
+    def _next_chunk(self):
+        while not self.stalled.is_set():
+            try:
+                chunk = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if chunk is None:
+                self._eof = True
+            else:
+                self._buffer = chunk
+            return
+        raise OSError("Destination was dropped for not reading")
+
+    def readinto(self, buffer) -> int:
+        # Fill the whole buffer: boto3 decides on multipart from short reads
+        count = 0
+        while count < len(buffer):
+            if not self._buffer:
+                if self._eof:
+                    break
+                self._next_chunk()
+                continue
+            size = min(len(buffer) - count, len(self._buffer))
+            buffer[count : count + size] = self._buffer[:size]
+            self._buffer = self._buffer[size:]
+            count += size
+        self._position += count
+        return count
+
+
+class FanoutBackend(Backend):
+    def __init__(
+        self,
+        backends: List[Backend],
+        chunk_size: int = MEGABYTE,
+        queue_size: int = 16,
+        stall_timeout: float = 300,
+        required: int = None,
+    ) -> None:
+        super().__init__()
+        if not backends:
+            raise ValueError("FanoutBackend needs at least one backend")
+        # Destinations that must succeed for an upload to count, default all
+        self.required = len(backends) if required is None else required
+        if not 1 <= self.required <= len(backends):
+            raise ValueError(f"required must be between 1 and {len(backends)}")
+        self.backends = backends
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.stall_timeout = stall_timeout
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def _names(self) -> List[str]:
+        return [
+            f"{index}:{backend.__class__.__name__}"
+            for index, backend in enumerate(self.backends)
+        ]
+
+    def upload(self, key: str, data: BinaryIO) -> Dict[str, Optional[Exception]]:
+        self._logger.info(f"Uploading {key} to {len(self.backends)} destinations")
+        names = self._names()
+        results = dict.fromkeys(names)
+        with data:
+            size = data.tell()
+            data.seek(0)
+            readers = [_FanoutReader(size, self.queue_size) for _ in self.backends]
+
+            def consume(name: str, backend: Backend, reader: _FanoutReader):
+                try:
+                    backend.upload(key, reader)
+                except Exception as err:
+                    results[name] = err
+                finally:
+                    reader.done.set()
+
+            threads = [
+                threading.Thread(target=consume, args=args, daemon=True)
+                for args in zip(names, self.backends, readers)
+            ]
+            for thread in threads:
+                thread.start()
+            while chunk := data.read(self.chunk_size):
+                fed = [reader.feed(chunk, self.stall_timeout) for reader in readers]
+                if not any(fed):
+                    break
+            for reader in readers:
+                reader.feed(None, self.stall_timeout)
+            # A stalled destination may never return, so it is not waited on
+            for thread, reader in zip(threads, readers):
+                if not reader.stalled.is_set():
+                    thread.join()
+
+        for name, reader in zip(names, readers):
+            if reader.stalled.is_set():
+                results[name] = TimeoutError(
+                    f"No data read for {self.stall_timeout}s, destination dropped"
+                )
+        for name, err in results.items():
+            if err is None:
+                self._logger.info(f"Destination {name} finished {key}")
+            else:
+                self._logger.error(f"Destination {name} failed {key}: {err}")
+        succeeded = sum(err is None for err in results.values())
+        if succeeded < self.required:
+            raise FanoutError(
+                f"{key} stored on {succeeded} of {len(results)} destinations, "
+                f"{self.required} required",
+                results,
+            )
+        return results
+
+    def download(self, key: str) -> BinaryIO:
+        for name, backend in zip(self._names(), self.backends):
+            try:
+                return backend.download(key)
+            except Exception as err:
+                self._logger.warning(f"Destination {name} could not serve {key}: {err}")
+        raise FileNotFoundError(f"No destination could serve {key}")
+
+
+def create_backend(config: Union[Dict, List[Dict]]) -> Backend:
+    if isinstance(config, list):
+        return FanoutBackend([create_backend(item) for item in config])
+    config = dict(config)
+    backend_type = config.pop("type", "s3")
+    if backend_type == "s3":
+        return S3Backend(**config)
+    if backend_type == "local":
+        return LocalBackend(**config)
+    raise ValueError(f"Unknown backend type: {backend_type}")
@@ -1,14 +1,26 @@
+import fcntl
+import fnmatch
+import functools
+import hashlib
+import json
+import os
 import pathlib
-from typing import Union
+import tempfile
+from typing import Callable, Iterable, Optional, Union
 
 import dotenv
 import restic
 from studiop import logging
+from studiop.constants import READ, UTF_8, WRITE
 from studiop.sdk import utils
 
 logger = logging.getLogger(__name__)
 
+CACHE_DIR = pathlib.Path().home().joinpath(".cache/studiop")
+FINGERPRINT_FILE = CACHE_DIR.joinpath("fingerprints.json")
+
 SUMMARY_KEYS = [
+    "skipped",
     "files_new",
     "file_changed",
     "dirs_new",
@@ -23,6 +35,124 @@ def parse_summary(summary: dict) -> dict:
     return {k: v for k, v in summary.items() if k in SUMMARY_KEYS}
 
 
+def match_parts(pattern: list[str], path: list[str]) -> bool:
+    # Per path component, like restic: "*" stops at "/", "**" spans folders
+    if not pattern:
+        return not path
+    if pattern[0] == "**":
+        return any(match_parts(pattern[1:], path[i:]) for i in range(len(path) + 1))
+    return (
+        bool(path)
+        and fnmatch.fnmatchcase(path[0], pattern[0])
+        and match_parts(pattern[1:], path[1:])
+    )
+
+
+def create_exclude_matcher(exclude: Iterable[str] = ()) -> Callable[[str], bool]:
+    # Absolute patterns match from the root, others at any depth. Anything
+    # this does not match stays in the fingerprint, so a doubt never skips.
+    patterns = []
+    for pattern in exclude:
+        parts = [part for part in pattern.rstrip("/").split("/") if part]
+        if not parts:
+            continue
+        patterns.append(parts if pattern.startswith("/") else ["**"] + parts)
+
+    def excluded(path: str) -> bool:
+        parts = [part for part in path.split("/") if part]
+        return any(match_parts(pattern, parts) for pattern in patterns)
+
+    return excluded
+
+
+def fingerprint_tree(
+    path: Union[str, pathlib.Path], exclude: Iterable[str] = ()
+) -> str:
+    # Cheap change detector: path, size and mtime of everything under path.
+    # Unreadable entries are folded into the digest instead of aborting.
+    digest = hashlib.blake2b(digest_size=32)
+    excluded = create_exclude_matcher(exclude)
+
+    def add(entry_path: str, stat: Callable[[], os.stat_result]):
+        try:
+            stats = stat()
+            record = f"{entry_path}\0{stats.st_size}\0{stats.st_mtime_ns}\n"
+        except OSError as err:
+            record = f"{entry_path}\0error\0{err.errno}\n"
+        digest.update(record.encode())
+
+    path = pathlib.Path(path).absolute()
+    add(str(path), path.stat)
+    if not path.is_dir():
+        return digest.hexdigest()
+    stack = [str(path)]
+    while stack:
+        folder = stack.pop()
+        try:
+            with os.scandir(folder) as entries:
+                entries = sorted(entries, key=lambda item: item.name)
+        except OSError as err:
+            digest.update(f"{folder}\0error\0{err.errno}\n".encode())
+            continue
+        for entry in entries:
+            if excluded(entry.path):
+                continue
+            add(entry.path, functools.partial(entry.stat, follow_symlinks=False))
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+            except OSError:
+                pass
+    return digest.hexdigest()
+
+
+class FingerprintCache:
+    def __init__(self, path: Union[str, pathlib.Path] = FINGERPRINT_FILE) -> None:
+        self.path = pathlib.Path(path)
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    @staticmethod
+    def _key(src: Union[str, pathlib.Path], repo: str) -> str:
+        return f"{repo}::{pathlib.Path(src).resolve()}"
+
+    def _load(self) -> dict:
+        if not self.path.exists():
+            return {}
+        try:
+            with self.path.open(READ, encoding=UTF_8) as fp:
+                return json.load(fp)
+        except json.decoder.JSONDecodeError as err:
+            self._logger.warning(f"Ignoring corrupt fingerprint cache: {err}")
+            return {}
+
+    def get(self, src: Union[str, pathlib.Path], repo: str) -> Optional[dict]:
+        return self._load().get(self._key(src, repo))
+
+    def set(
+        self,
+        src: Union[str, pathlib.Path],
+        repo: str,
+        fingerprint: str,
+        snapshot_id: str,
+    ):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        lock_path = self.path.with_name(f"{self.path.name}.lock")
+        # The file is shared by every source, so concurrent backups take a
+        # lock around the read-modify-write and never share a temp file
+        with lock_path.open(WRITE) as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            cache = self._load()
+            cache[self._key(src, repo)] = {
+                "fingerprint": fingerprint,
+                "snapshot_id": snapshot_id,
+            }
+            with tempfile.NamedTemporaryFile(
+                WRITE, encoding=UTF_8, dir=self.path.parent, delete=False
+            ) as fp:
+                json.dump(cache, fp, indent=2)
+            pathlib.Path(fp.name).replace(self.path)
+
+
 class BackupTask:
     def __init__(
         self,
@@ -31,7 +161,7 @@ class BackupTask:
         exclude: list[str] = None,
     ) -> None:
         self.src = src
-        self.dest = (dest,)
+        self.dest = dest
         self.exclude = exclude
         self._logger = logging.getLogger(self.__class__.__name__)
 
@@ -39,25 +169,71 @@ class BackupTask:
         pass
 
 
+class FingerprintCheck:
+    # Skip and summary logic shared by the sync and async backup tasks
+    def __init__(
+        self,
+        src: Union[str, pathlib.Path],
+        repo: str,
+        exclude: list[str] = None,
+        force: bool = False,
+        fingerprints: FingerprintCache = None,
+    ) -> None:
+        self.src = src
+        self.exclude = exclude
+        self.force = force
+        # Excludes are part of the key, changing them must not skip a backup
+        self.repo_key = f"{repo}::{','.join(sorted(exclude or []))}"
+        self.fingerprint = None
+        self._fingerprints = fingerprints or FingerprintCache()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def unchanged(self) -> Optional[dict]:
+        self.fingerprint = fingerprint_tree(self.src, self.exclude or ())
+        previous = self._fingerprints.get(self.src, self.repo_key)
+        if self.force or not previous or previous["fingerprint"] != self.fingerprint:
+            return None
+        self._logger.info(f"No changes in {self.src}, skipping restic backup")
+        return parse_summary({"skipped": True, "snapshot_id": previous["snapshot_id"]})
+
+    def finish(self, raw_summary: dict) -> dict:
+        summary = parse_summary(raw_summary or {})
+        summary["skipped"] = False
+        if (snapshot_id := summary.get("snapshot_id")) and self.fingerprint:
+            self._fingerprints.set(
+                self.src, self.repo_key, self.fingerprint, snapshot_id
+            )
+        return summary
+
+
 class Backup(BackupTask):
     def __init__(
         self,
         src: Union[str, pathlib.Path],
         dest: Union[str, pathlib.Path],
         exclude: list[str] = None,
+        force: bool = False,
+        fingerprints: FingerprintCache = None,
     ) -> None:
         super().__init__(src, dest, exclude=exclude)
         restic.repository = self.dest
+        self._check = FingerprintCheck(
+            src, str(dest), exclude=exclude, force=force, fingerprints=fingerprints
+        )
 
     def run(self):
         self._logger.info("Starting backup")
+        if summary := self._check.unchanged():
+            self._logger.info(utils.print_dict(summary))
+            return summary
+
         kwargs = {"paths": [self.src]}
         if self.exclude:
             kwargs["exclude_patterns"] = self.exclude
-        summary = restic.backup(**kwargs)
-        summary = parse_summary(summary)
+        summary = self._check.finish(restic.backup(**kwargs))
         self._logger.info("Backup task finished")
         self._logger.info(utils.print_dict(summary))
+        return summary
 
 
 class BackupSync(BackupTask):
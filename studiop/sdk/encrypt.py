@@ -29,7 +29,73 @@ class Cryptor(metaclass=abc.ABCMeta):
         raise NotImplementedError
 
 
-class TinkCryptor(Cryptor):
+class StreamingCryptor(metaclass=abc.ABCMeta):
+    # Optional capability: ciphertext produced while the result is read,
+    # without a temporary copy of the input
+    @abc.abstractmethod
+    def encrypting_stream(
+        self, data: BinaryIO, associated_data: Union[str, bytes] = b""
+    ) -> BinaryIO:
+        raise NotImplementedError
+
+
+class _ChunkSink(io.RawIOBase):
+    # Ciphertext destination that keeps written bytes until they are read back
+    def __init__(self) -> None:
+        super().__init__()
+        self.buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        return len(data)
+
+
+class EncryptingReader(io.RawIOBase):
+    # Ciphertext of data, encrypted chunk by chunk as it is read. Unlike
+    # TinkCryptor.encrypt no temporary copy of the input is written.
+    def __init__(
+        self,
+        primitive: streaming_aead.StreamingAead,
+        data: BinaryIO,
+        associated_data: bytes,
+        chunk_size: int = MEGABYTE,
+    ) -> None:
+        super().__init__()
+        self._data = data
+        self._chunk_size = chunk_size
+        self._sink = _ChunkSink()
+        self._crypt_stream = primitive.new_encrypting_stream(
+            self._sink, associated_data
+        )
+        self._finished = False
+
+    def readable(self) -> bool:
+        return True
+
+    def _fill(self):
+        chunk = self._data.read(self._chunk_size)
+        if not chunk:
+            self._crypt_stream.close()
+            self._finished = True
+            return
+        view = memoryview(chunk)
+        while view:
+            view = view[self._crypt_stream.write(view) or 0 :]
+
+    def readinto(self, buffer) -> int:
+        # Fill the whole buffer: boto3 decides on multipart from short reads
+        while len(self._sink.buffer) < len(buffer) and not self._finished:
+            self._fill()
+        count = min(len(buffer), len(self._sink.buffer))
+        buffer[:count] = self._sink.buffer[:count]
+        del self._sink.buffer[:count]
+        return count
+
+
+class TinkCryptor(Cryptor, StreamingCryptor):
     def __init__(
         self,
         keyfile: Union[str, pathlib.Path],
@@ -92,6 +158,15 @@ class TinkCryptor(Cryptor):
                 crypt_file.unlink()
         return output_stream
 
+    def encrypting_stream(
+        self, data: BinaryIO, associated_data: Union[str, bytes] = b""
+    ) -> BinaryIO:
+        if isinstance(associated_data, str):
+            associated_data = associated_data.encode()
+        return EncryptingReader(
+            self._primitive, data, associated_data, chunk_size=self.chunk_size
+        )
+
     def decrypt(
         self, data: BinaryIO, associated_data: Union[str, bytes] = b""
     ) -> BinaryIO:
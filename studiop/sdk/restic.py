@@ -1,10 +1,25 @@
+import hashlib
 import json
 import os
 import pathlib
 import subprocess
-from typing import Union
+import tempfile
+import threading
+from concurrent import futures
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Optional, TypeVar, Union
 
 from studiop import logging
+from studiop.constants import READ, UTF_8, WRITE
+
+CACHE_DIR = pathlib.Path().home().joinpath(".cache/studiop/restic")
+SNAPSHOT_BATCH = 100
+
+T = TypeVar("T")
+
+
+class ResticError(Exception):
+    pass
 
 
 class ResticRepo:
@@ -16,6 +31,71 @@ class ResticRepo:
     def password(self) -> str:
         return self._password
 
+    @property
+    def env(self) -> dict[str, str]:
+        return {"RESTIC_REPOSITORY": self.path, "RESTIC_PASSWORD": self.password}
+
+
+@dataclass
+class Snapshot:
+    id: str
+    short_id: str
+    time: str
+    tree: str
+    paths: list[str]
+    hostname: str = ""
+    username: str = ""
+    tags: list[str] = field(default_factory=list)
+    parent: Optional[str] = None
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Snapshot":
+        return cls(
+            id=data["id"],
+            short_id=data.get("short_id", data["id"][:8]),
+            time=data["time"],
+            tree=data["tree"],
+            paths=data.get("paths", []),
+            hostname=data.get("hostname", ""),
+            username=data.get("username", ""),
+            tags=data.get("tags") or [],
+            parent=data.get("parent"),
+        )
+
+
+@dataclass
+class RepoStats:
+    total_size: int
+    total_file_count: int
+    snapshots_count: int = 0
+
+    @classmethod
+    def from_json(cls, data: dict) -> "RepoStats":
+        return cls(
+            total_size=data.get("total_size", 0),
+            total_file_count=data.get("total_file_count", 0),
+            snapshots_count=data.get("snapshots_count", 0),
+        )
+
+
+@dataclass
+class Node:
+    name: str
+    type: str
+    path: str
+    size: int = 0
+    mtime: str = ""
+
+    @classmethod
+    def from_json(cls, data: dict) -> "Node":
+        return cls(
+            name=data["name"],
+            type=data["type"],
+            path=data["path"],
+            size=data.get("size", 0),
+            mtime=data.get("mtime", ""),
+        )
+
 
 class Restic:
     def __init__(self, bin_path: str = "restic", output: str = "json") -> None:
@@ -36,10 +116,14 @@ class Restic:
         args.append(self.output)
         return args
 
-    def _run(self) -> subprocess.CompletedProcess:
+    def _run(self, env: dict[str, str] = None) -> subprocess.CompletedProcess:
         try:
             return subprocess.run(
-                self._gather_args(), check=True, capture_output=True, encoding="utf-8"
+                self._gather_args(),
+                check=True,
+                capture_output=True,
+                encoding="utf-8",
+                env={**os.environ, **env} if env else None,
             )
         except subprocess.CalledProcessError as err:
             self._logger.error(err)
@@ -48,6 +132,27 @@ class Restic:
         finally:
             self._reset()
 
+    def _set_backup(self, src: Union[str, pathlib.Path], exclude: list[str] = None):
+        self.cmd = "backup"
+        if exclude:
+            self.flags += sum([["--exclude", item] for item in exclude], [])
+        self.flags.append(str(src))
+
+    def backup_args(
+        self, src: Union[str, pathlib.Path], exclude: list[str] = None
+    ) -> list[str]:
+        self._set_backup(src, exclude)
+        args = self._gather_args()
+        self._reset()
+        return args
+
+    def parse_backup(self, stdout: str) -> dict:
+        lines = [line.strip() for line in stdout.split("\n") if line.strip()]
+        try:
+            return json.loads(lines[-1])
+        except (IndexError, json.decoder.JSONDecodeError) as err:
+            self._logger.error(err)
+
     def backup(
         self,
         src: Union[str, pathlib.Path],
@@ -58,19 +163,11 @@ class Restic:
         if not src.exists():
             raise FileNotFoundError(f"Source path {src} does not exist")
 
-        self.cmd = "backup"
         os.putenv("RESTIC_REPOSITORY", dest.path)
         os.putenv("RESTIC_PASSWORD", dest.password)
-        if exclude:
-            self.flags += sum([["--exclude", item] for item in exclude], [])
-        self.flags.append(str(src))
+        self._set_backup(src, exclude)
         raw_result = self._run()
-        lines = [line.strip() for line in raw_result.stdout.split("\n")]
-
-        try:
-            return json.loads(lines[-1])
-        except json.decoder.JSONDecodeError as err:
-            self._logger.error(err)
+        return self.parse_backup(raw_result.stdout)
 
     def copy(
         self,
@@ -107,6 +204,209 @@ class Restic:
             self.flags.append("--prune")
         return self._run().stdout
 
+    def _query(self, repo: ResticRepo) -> str:
+        result = self._run(env=repo.env)
+        if result is None:
+            raise ResticError(f"Query against {repo.path} failed")
+        return result.stdout
+
+    def list_ids(self, repo: ResticRepo, kind: str) -> list[str]:
+        self.cmd = "list"
+        self.flags.append(kind)
+        return sorted(line.strip() for line in self._query(repo).split() if line)
+
+    def snapshots(self, repo: ResticRepo, ids: list[str] = None) -> list[Snapshot]:
+        self.cmd = "snapshots"
+        if ids:
+            self.flags += ids
+        return [Snapshot.from_json(item) for item in json.loads(self._query(repo))]
+
+    def stats(self, repo: ResticRepo, mode: str = "restore-size") -> RepoStats:
+        self.cmd = "stats"
+        self.flags += ["--mode", mode]
+        return RepoStats.from_json(json.loads(self._query(repo)))
+
+    def ls(self, repo: ResticRepo, snapshot_id: str) -> list[Node]:
+        self.cmd = "ls"
+        self.flags.append(snapshot_id)
+        nodes = []
+        for line in self._query(repo).splitlines():
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if item.get("struct_type", "node") == "node":
+                nodes.append(Node.from_json(item))
+        return nodes
+
+
+class ResticCache:
+    # Query results cached per repository. Snapshots and listings are
+    # immutable per snapshot ID, so a refresh only fetches new snapshots; stats
+    # are keyed on the snapshot and index IDs and recomputed when they change.
+    # Listings get a file per snapshot so the state file stays small.
+    def __init__(
+        self,
+        bin_path: str = "restic",
+        cache_dir: Union[str, pathlib.Path] = CACHE_DIR,
+    ) -> None:
+        self.bin = bin_path
+        self.cache_dir = pathlib.Path(cache_dir)
+        self._lock = threading.Lock()
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+    def _restic(self) -> Restic:
+        # Restic builds commands in instance state, so each query gets its own
+        return Restic(self.bin)
+
+    def _repo_name(self, repo: ResticRepo) -> str:
+        return hashlib.sha256(repo.path.encode(UTF_8)).hexdigest()[:16]
+
+    def _cache_file(self, repo: ResticRepo) -> pathlib.Path:
+        return self.cache_dir.joinpath(f"{self._repo_name(repo)}.json")
+
+    def _ls_file(self, repo: ResticRepo, snapshot_id: str) -> pathlib.Path:
+        return self.cache_dir.joinpath(self._repo_name(repo), f"{snapshot_id}.json")
+
+    def _write(self, path: pathlib.Path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            WRITE, encoding=UTF_8, dir=path.parent, delete=False
+        ) as fp:
+            json.dump(data, fp)
+        pathlib.Path(fp.name).replace(path)
+
+    def _load(self, repo: ResticRepo) -> dict:
+        cache_file = self._cache_file(repo)
+        if cache_file.exists():
+            try:
+                with cache_file.open(READ, encoding=UTF_8) as fp:
+                    cache = json.load(fp)
+                if cache.get("path") == repo.path:
+                    return cache
+            except json.decoder.JSONDecodeError as err:
+                self._logger.warning(f"Ignoring corrupt cache {cache_file}: {err}")
+        return {"path": repo.path, "state": "", "snapshots": {}, "stats": {}}
+
+    def _save(self, repo: ResticRepo, cache: dict):
+        with self._lock:
+            # Keep stats saved meanwhile by other queries on the same state
+            current = self._load(repo)
+            if current["state"] == cache["state"]:
+                cache["stats"] = {**current["stats"], **cache["stats"]}
+            self._write(self._cache_file(repo), cache)
+
+    def _fetch_snapshots(
+        self, restic: Restic, repo: ResticRepo, missing: list[str], total: int
+    ) -> list[Snapshot]:
+        # Listing everything is cheaper than passing most IDs on the command
+        # line, and a batch size keeps the arguments well below ARG_MAX
+        if len(missing) * 2 > total:
+            return restic.snapshots(repo)
+        snapshots = []
+        for start in range(0, len(missing), SNAPSHOT_BATCH):
+            batch = missing[start : start + SNAPSHOT_BATCH]
+            snapshots += restic.snapshots(repo, batch)
+        return snapshots
+
+    def refresh(self, repo: ResticRepo) -> dict:
+        restic = self._restic()
+        snapshot_ids = restic.list_ids(repo, "snapshots")
+        index_ids = restic.list_ids(repo, "index")
+        state = hashlib.sha256(
+            "\n".join(snapshot_ids + ["--"] + index_ids).encode(UTF_8)
+        ).hexdigest()
+        cache = self._load(repo)
+        if cache["state"] == state:
+            return cache
+
+        self._logger.info(f"Refreshing cached metadata for {repo.path}")
+        current = set(snapshot_ids)
+        known = {
+            snapshot_id: data
+            for snapshot_id, data in cache["snapshots"].items()
+            if snapshot_id in current
+        }
+        if missing := [item for item in snapshot_ids if item not in known]:
+            for snapshot in self._fetch_snapshots(
+                restic, repo, missing, len(snapshot_ids)
+            ):
+                if snapshot.id in current:
+                    known[snapshot.id] = asdict(snapshot)
+        for snapshot_id in cache["snapshots"].keys() - known.keys():
+            self._ls_file(repo, snapshot_id).unlink(missing_ok=True)
+        cache["snapshots"] = known
+        cache["stats"] = {}
+        cache["state"] = state
+        self._save(repo, cache)
+        return cache
+
+    def snapshots(self, repo: ResticRepo) -> list[Snapshot]:
+        cache = self.refresh(repo)
+        snapshots = [Snapshot(**data) for data in cache["snapshots"].values()]
+        return sorted(snapshots, key=lambda snapshot: snapshot.time)
+
+    def latest(
+        self, repo: ResticRepo, path: Union[str, pathlib.Path] = None
+    ) -> Optional[Snapshot]:
+        snapshots = self.snapshots(repo)
+        if path is not None:
+            snapshots = [item for item in snapshots if str(path) in item.paths]
+        return snapshots[-1] if snapshots else None
+
+    def stats(self, repo: ResticRepo, mode: str = "restore-size") -> RepoStats:
+        cache = self.refresh(repo)
+        if mode not in cache["stats"]:
+            cache["stats"][mode] = asdict(self._restic().stats(repo, mode=mode))
+            self._save(repo, cache)
+        return RepoStats(**cache["stats"][mode])
+
+    def _resolve(self, cache: dict, snapshot_id: str) -> str:
+        if snapshot_id == "latest":
+            snapshots = sorted(cache["snapshots"].values(), key=lambda s: s["time"])
+            if snapshots:
+                return snapshots[-1]["id"]
+        else:
+            matches = [
+                item for item in cache["snapshots"] if item.startswith(snapshot_id)
+            ]
+            if len(matches) == 1:
+                return matches[0]
+        raise ResticError(f"No unique snapshot {snapshot_id} in {cache['path']}")
+
+    def ls(self, repo: ResticRepo, snapshot_id: str) -> list[Node]:
+        cache = self.refresh(repo)
+        snapshot_id = self._resolve(cache, snapshot_id)
+        ls_file = self._ls_file(repo, snapshot_id)
+        try:
+            with ls_file.open(READ, encoding=UTF_8) as fp:
+                return [Node(**data) for data in json.load(fp)]
+        except FileNotFoundError:
+            pass
+        except json.decoder.JSONDecodeError as err:
+            self._logger.warning(f"Ignoring corrupt cache {ls_file}: {err}")
+        nodes = self._restic().ls(repo, snapshot_id)
+        self._write(ls_file, [asdict(node) for node in nodes])
+        return nodes
+
+    def query_many(
+        self,
+        repos: list[ResticRepo],
+        query: Callable[[ResticRepo], T],
+        workers: int = 8,
+    ) -> dict[str, Union[T, Exception]]:
+        # A failing repository is reported in place, never fails the batch
+        results = {}
+        with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            jobs = {executor.submit(query, repo): repo for repo in repos}
+            for job in futures.as_completed(jobs):
+                repo = jobs[job]
+                try:
+                    results[repo.path] = job.result()
+                except Exception as err:
+                    self._logger.error(f"Query against {repo.path} failed: {err}")
+                    results[repo.path] = err
+        return results
+
 
 # r = restic.Restic()
 # r.backup(src, dest, exclude=[])
@@ -1,10 +1,19 @@
 import abc
+import json
 import pathlib
-from typing import List, Union
+import tempfile
+from concurrent import futures
+from typing import BinaryIO, List, Union
 
 from studiop import logging
+from studiop.constants import MEGABYTE, UTF_8
 from studiop.sdk import archive, backend, encrypt
 
+MANIFEST_NAME = "manifest.json"
+VOLUME_NAME = "volume-{:05d}"
+DEFAULT_VOLUME_SIZE = 1024 * MEGABYTE
+DEFAULT_WORKERS = 4
+
 
 class Task(metaclass=abc.ABCMeta):
     @abc.abstractmethod
@@ -12,17 +21,17 @@ class Task(metaclass=abc.ABCMeta):
         raise NotImplementedError
 
 
-class ArchiveTask(Task):
-    def __init__(
+class ArchiveSetup:
+    # Constructor setup shared by ArchiveTask and aio.AsyncArchiveTask
+    def _setup(
         self,
         source: Union[str, pathlib.Path],
-        backend: backend.Backend,
-        archiver: archive.Archiver,
+        backend,
+        archiver,
         dest: str = "",
         exclude: List[str] = None,
-        encryptor: encrypt.Cryptor = None,
-    ) -> None:
-        super().__init__()
+        encryptor=None,
+    ):
         self.src = pathlib.Path(source)
         if not self.src.exists():
             raise FileNotFoundError(f"Source file/folder '{source}' does not exist")
@@ -34,6 +43,40 @@ class ArchiveTask(Task):
         self._encryptor = encryptor
         self._logger = logging.getLogger(self.__class__.__name__)
 
+
+class UnarchiveSetup:
+    # Constructor setup shared by UnarchiveTask and aio.AsyncUnarchiveTask
+    def _setup(
+        self,
+        source: str,
+        backend,
+        archiver,
+        dest: Union[str, pathlib.Path] = ".",
+        decryptor=None,
+    ):
+        self.key = source
+        self.dest = pathlib.Path(dest)
+        if not self.dest.exists():
+            raise FileNotFoundError(self.dest)
+        self._uploader = backend
+        self._archiver = archiver
+        self._decryptor = decryptor
+        self._logger = logging.getLogger(self.__class__.__name__)
+
+
+class ArchiveTask(ArchiveSetup, Task):
+    def __init__(
+        self,
+        source: Union[str, pathlib.Path],
+        backend: backend.Backend,
+        archiver: archive.Archiver,
+        dest: str = "",
+        exclude: List[str] = None,
+        encryptor: encrypt.Cryptor = None,
+    ) -> None:
+        super().__init__()
+        self._setup(source, backend, archiver, dest, exclude, encryptor)
+
     def run(self):
         self._logger.info(f"Started archive task: {self.src}")
         archived = self._archiver.archive(self.src, self.exclude)
@@ -43,7 +86,7 @@ class ArchiveTask(Task):
         self._logger.info(f"Completed archive task: {self.src}")
 
 
-class UnarchiveTask(Task):
+class UnarchiveTask(UnarchiveSetup, Task):
     def __init__(
         self,
         source: str,
@@ -53,14 +96,7 @@ class UnarchiveTask(Task):
         decryptor: encrypt.Cryptor = None,
     ) -> None:
         super().__init__()
-        self.key = source
-        self.dest = pathlib.Path(dest)
-        if not self.dest.exists():
-            raise FileNotFoundError(self.dest)
-        self._uploader = backend
-        self._archiver = archiver
-        self._decryptor = decryptor
-        self._logger = logging.getLogger(self.__class__.__name__)
+        self._setup(source, backend, archiver, dest, decryptor)
 
     def run(self):
         self._logger.info(f"Started unarchive task: {self.key}")
@@ -69,3 +105,144 @@ class UnarchiveTask(Task):
             downloaded = self._decryptor.decrypt(downloaded, self.key)
         self._archiver.unarchive(downloaded, self.dest)
         self._logger.info(f"Completed unarchive task: {self.key}")
+
+
+class VolumeArchiveTask(ArchiveTask):
+    def __init__(
+        self,
+        source: Union[str, pathlib.Path],
+        backend: backend.Backend,
+        archiver: archive.Archiver,
+        dest: str = "",
+        exclude: List[str] = None,
+        encryptor: encrypt.Cryptor = None,
+        volume_size: int = DEFAULT_VOLUME_SIZE,
+        workers: int = DEFAULT_WORKERS,
+    ) -> None:
+        if not isinstance(archiver, archive.MemberArchiver):
+            raise TypeError(f"{archiver.__class__.__name__} cannot archive volumes")
+        super().__init__(
+            source, backend, archiver, dest=dest, exclude=exclude, encryptor=encryptor
+        )
+        self.volume_size = volume_size
+        self.workers = workers
+
+    def _volume_key(self, index: int) -> str:
+        return f"{self.dest}/{VOLUME_NAME.format(index)}"
+
+    def _upload_volume(self, index: int, members: List[pathlib.Path]):
+        key = self._volume_key(index)
+        self._logger.info(f"Started volume {index}: {len(members)} items")
+        archived = self._archiver.archive_members(self.src, members)
+        if self._encryptor:
+            archived = self._encryptor.encrypt(archived, key)
+        self._backend.upload(key, archived)
+        self._logger.info(f"Completed volume {index}: {key}")
+
+    def _upload_manifest(self, volumes: List[List[pathlib.Path]]):
+        key = f"{self.dest}/{MANIFEST_NAME}"
+        manifest = {
+            "source": self.src.name,
+            "volume_size": self.volume_size,
+            "volumes": [
+                {
+                    "key": self._volume_key(index),
+                    "members": [
+                        str(member.relative_to(self.src.parent)) for member in members
+                    ],
+                }
+                for index, members in enumerate(volumes)
+            ],
+        }
+        data = tempfile.TemporaryFile()
+        data.write(json.dumps(manifest).encode(UTF_8))
+        if self._encryptor:
+            data = self._encryptor.encrypt(data, key)
+        self._backend.upload(key, data)
+
+    def run(self):
+        self._logger.info(f"Started volume archive task: {self.src}")
+        volumes = archive.plan_volumes(self.src, self.volume_size, self.exclude)
+        self._logger.info(f"Planned {len(volumes)} volumes for {self.src}")
+        failed = []
+        with futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            jobs = {
+                executor.submit(self._upload_volume, index, members): index
+                for index, members in enumerate(volumes)
+            }
+            for job in futures.as_completed(jobs):
+                if err := job.exception():
+                    self._logger.error(f"Volume {jobs[job]} failed: {err}")
+                    failed.append(jobs[job])
+        # A manifest is only written once every volume it lists is stored
+        if failed:
+            raise RuntimeError(
+                f"Volumes {sorted(failed)} of {self.src} failed, manifest not written"
+            )
+        self._upload_manifest(volumes)
+        self._logger.info(f"Completed volume archive task: {self.src}")
+
+
+class VolumeUnarchiveTask(UnarchiveTask):
+    def __init__(
+        self,
+        source: str,
+        backend: backend.Backend,
+        archiver: archive.Archiver,
+        dest: Union[str, pathlib.Path] = ".",
+        decryptor: encrypt.Cryptor = None,
+        volume: int = None,
+        path: str = None,
+        workers: int = DEFAULT_WORKERS,
+    ) -> None:
+        if not isinstance(archiver, archive.MemberArchiver):
+            raise TypeError(f"{archiver.__class__.__name__} cannot extract volumes")
+        super().__init__(source, backend, archiver, dest=dest, decryptor=decryptor)
+        self.volume = volume
+        self.path = path.strip("/") if path else path
+        self.workers = workers
+
+    def _fetch(self, key: str) -> BinaryIO:
+        downloaded = self._uploader.download(key)
+        if self._decryptor:
+            downloaded = self._decryptor.decrypt(downloaded, key)
+        return downloaded
+
+    def _read_manifest(self) -> dict:
+        with self._fetch(f"{self.key}/{MANIFEST_NAME}") as data:
+            data.seek(0)
+            return json.loads(data.read().decode(UTF_8))
+
+    def _contains(self, volume: dict) -> bool:
+        return any(
+            member == self.path or member.startswith(f"{self.path}/")
+            for member in volume["members"]
+        )
+
+    def _select(self, volumes: List[dict]) -> List[dict]:
+        if self.volume is not None:
+            if not 0 <= self.volume < len(volumes):
+                raise IndexError(f"{self.key} has no volume {self.volume}")
+            volumes = [volumes[self.volume]]
+        if self.path is not None:
+            volumes = [volume for volume in volumes if self._contains(volume)]
+            if not volumes:
+                raise FileNotFoundError(f"{self.path} is not in {self.key}")
+        return volumes
+
+    def run(self):
+        self._logger.info(f"Started volume unarchive task: {self.key}")
+        keys = [
+            volume["key"] for volume in self._select(self._read_manifest()["volumes"])
+        ]
+        # Downloads run in parallel, extraction in volume order on this thread
+        # since volumes share folders. Folder attributes are applied last.
+        folders = []
+        with futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+            jobs = [executor.submit(self._fetch, key) for key in keys]
+            for key, job in zip(keys, jobs):
+                with job.result() as downloaded:
+                    folders += self._archiver.unarchive_members(downloaded, self.dest)
+                self._logger.info(f"Restored volume {key}")
+        self._archiver.finish_unarchive(folders, self.dest)
+        self._logger.info(f"Completed volume unarchive task: {self.key}")